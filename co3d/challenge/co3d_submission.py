@@ -14,6 +14,7 @@ import glob
 import hashlib
 import time
 from tabulate import tabulate
+from concurrent.futures import ThreadPoolExecutor
 
 from typing import Optional, Tuple, List
 from dataclasses import dataclass
@@ -245,6 +246,7 @@ class CO3DSubmission:
         )
         self.evaluate_exceptions_file = os.path.join(output_folder, "eval_exceptions.pkl")
         self.submission_cache = os.path.join(output_folder, "submission_cache")
+        self.submission_staging = os.path.join(output_folder, "submission_staging")
         os.makedirs(self.submission_cache, exist_ok=True)
         self._result_list: List[CO3DSubmissionRender] = []
         self._eval_batches_map = None
@@ -290,6 +292,7 @@ class CO3DSubmission:
         image: np.ndarray,
         mask: np.ndarray,
         depth: np.ndarray,
+        staged: bool = False,
     ) -> None:
         """
         Adds a single user-predicted image to the current submission.
@@ -311,6 +314,9 @@ class CO3DSubmission:
                 image.
                 The depth map should be of the same size as the corresponding
                 ground truth image.
+            staged: If `True`, stores the result files to the staging folder.
+                The staged results have to be moved to the submission cache
+                with `self.commit_staged_results` afterwards.
         """
         res = self._add_result_metadata(
             category,
@@ -318,7 +324,9 @@ class CO3DSubmission:
             sequence_name,
             frame_number,
         )
-        res_file = res.get_image_path(self.submission_cache)
+        res_file = res.get_image_path(
+            self.submission_staging if staged else self.submission_cache
+        )
         os.makedirs(os.path.dirname(res_file), exist_ok=True)
         logger.debug(f"Storing submission files {res_file}.")
         store_rgbda_frame(
@@ -326,6 +334,96 @@ class CO3DSubmission:
             res_file,
         )
 
+    def add_results_batch(
+        self,
+        category: str,
+        subset_name: str,
+        sequence_names: List[str],
+        frame_numbers: List[int],
+        images: List[np.ndarray],
+        masks: List[np.ndarray],
+        depths: List[np.ndarray],
+        num_workers: int = 4,
+        staged: bool = False,
+    ) -> None:
+        """
+        Adds a batch of user-predicted images to the current submission.
+        The result files are encoded and stored in parallel by `num_workers` threads.
+
+        Args:
+            category: The CO3D category of the images (e.g. "apple", "car").
+            subset_name: The name of the subset which the images come from
+                (e.g. "manyview_dev_0", "manyview_test_0").
+            sequence_names: The names of the sequences which the images come from.
+            frame_numbers: The numbers of the corresponding ground truth frames.
+            images: A list of 3xHxW RGB images (see `add_result`).
+            masks: A list of 1xHxW foreground masks (see `add_result`).
+            depths: A list of 1xHxW depth maps (see `add_result`).
+            num_workers: The number of threads storing the result files.
+            staged: If `True`, stores the result files to the staging folder
+                (see `add_result`).
+        """
+        n_results = len(sequence_names)
+        if not all(
+            len(x) == n_results for x in (frame_numbers, images, masks, depths)
+        ):
+            raise ValueError("All arguments have to contain the same number of results.")
+        res_files = []
+        for sequence_name, frame_number in zip(sequence_names, frame_numbers):
+            res = self._add_result_metadata(
+                category,
+                subset_name,
+                sequence_name,
+                frame_number,
+            )
+            res_files.append(
+                res.get_image_path(
+                    self.submission_staging if staged else self.submission_cache
+                )
+            )
+        for res_dir in set(os.path.dirname(f) for f in res_files):
+            os.makedirs(res_dir, exist_ok=True)
+        logger.debug(f"Storing {n_results} submission files.")
+        rgbda_frames = [
+            RGBDAFrame(image=image, mask=mask, depth=depth)
+            for image, mask, depth in zip(images, masks, depths)
+        ]
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            # consume the iterator to re-raise potential storage errors
+            list(executor.map(store_rgbda_frame, rgbda_frames, res_files))
+
+    def commit_staged_results(self, category: str, subset_name: str) -> None:
+        """
+        Move the results of a category subset that were added with `staged=True`
+        from the staging folder to the submission cache. In case the subset has no
+        results in the submission cache yet, the whole staging directory is moved
+        with a single rename.
+
+        Args:
+            category: CO3D category name (e.g. "apple", "orange")
+            subset_name: CO3D subset name (e.g. "manyview_dev_0", "manyview_test_0")
+        """
+        staged_dir = CO3DSubmission.get_submission_cache_image_dir(
+            self.submission_staging, category, subset_name
+        )
+        if not os.path.isdir(staged_dir):
+            return
+        cache_dir = CO3DSubmission.get_submission_cache_image_dir(
+            self.submission_cache, category, subset_name
+        )
+        logger.debug(f"Moving staged submission files {staged_dir} to {cache_dir}.")
+        if not os.path.isdir(cache_dir):
+            os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+            os.replace(staged_dir, cache_dir)
+        else:
+            for fl in os.listdir(staged_dir):
+                os.replace(os.path.join(staged_dir, fl), os.path.join(cache_dir, fl))
+            os.rmdir(staged_dir)
+        # remove the staging directories which became empty
+        for dir_ in (os.path.dirname(staged_dir), self.submission_staging):
+            if os.path.isdir(dir_) and len(os.listdir(dir_)) == 0:
+                os.rmdir(dir_)
+
     def _link_existing_render(
         self,
         render_submission_cache: str,
@@ -12,6 +12,13 @@ from typing import Optional
 from typing import Tuple
 from .data_types import RGBDAFrame
 
+try:
+    from numba import njit
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    # numba is missing or broken (e.g. incompatible with the installed numpy)
+    _NUMBA_AVAILABLE = False
+
 
 EVAL_METRIC_NAMES = ["psnr_masked", "psnr_fg", "psnr_full_image", "depth_abs_fg", "iou"]
 EVAL_METRIC_MISSING_VALUE = {
@@ -160,6 +167,19 @@ def calc_mse(
     """
     Calculates the mean square error between tensors `x` and `y`.
     """
+    if _NUMBA_AVAILABLE and x.shape == y.shape:
+        # fused single-pass reduction
+        x_, y_ = _as_flat_float32(x), _as_flat_float32(y)
+        if mask is None:
+            return _sq_err_sum_numba(x_, y_) / x_.shape[0]
+        elif x.ndim == 3 and mask.shape == (1, *x.shape[1:]):
+            n_channels = x.shape[0]
+            sq_err_sum, mask_mass = _masked_sq_err_sum_numba(
+                x_.reshape(n_channels, -1),
+                y_.reshape(n_channels, -1),
+                _as_flat_float32(mask),
+            )
+            return sq_err_sum / max(mask_mass, 1e-5)
     if mask is None:
         return np.mean((x - y) ** 2)
     else:
@@ -285,6 +305,17 @@ def calc_iou(
     This is a great loss because it emphasizes on the active
     regions of the predict and targets
     """
+    if (
+        _NUMBA_AVAILABLE
+        and mask is None
+        and threshold is not None
+        and predict.shape == target.shape
+    ):
+        # fused single-pass reduction
+        intersect, union = _iou_sums_numba(
+            _as_flat_float32(predict), _as_flat_float32(target), threshold
+        )
+        return intersect / (union + 1e-4)
     if threshold is not None:
         predict = (predict >= threshold).astype(np.float32)
         target = (target >= threshold).astype(np.float32)
@@ -329,6 +360,59 @@ def _get_1d_bounds(arr: np.ndarray) -> Tuple[int, int]:
     return nz[0], nz[-1]
 
 
+def _as_flat_float32(x: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(x, dtype=np.float32).reshape(-1)
+
+
+# The numba kernels are single-threaded on purpose: the metrics are evaluated in
+# a multiprocessing pool (see `evaluate_file_folders`), and serial reductions keep
+# the metric values deterministic.
+if _NUMBA_AVAILABLE:
+
+    @njit(cache=True)
+    def _sq_err_sum_numba(x, y):
+        """
+        Sum of squared differences between flat arrays `x` and `y`.
+        """
+        sq_err_sum = 0.0
+        for i in range(x.shape[0]):
+            d = x[i] - y[i]
+            sq_err_sum += d * d
+        return sq_err_sum
+
+    @njit(cache=True)
+    def _masked_sq_err_sum_numba(x, y, mask):
+        """
+        Masked sum of squared differences between CxN arrays `x` and `y` and
+        the mass of the N-dim `mask` broadcasted over the C channels.
+        """
+        n_channels = x.shape[0]
+        sq_err_sum = 0.0
+        mask_mass = 0.0
+        for i in range(x.shape[1]):
+            m = mask[i]
+            for c in range(n_channels):
+                d = x[c, i] - y[c, i]
+                sq_err_sum += d * d * m
+            mask_mass += m * n_channels
+        return sq_err_sum, mask_mass
+
+    @njit(cache=True)
+    def _iou_sums_numba(predict, target, threshold):
+        """
+        Intersection and union of flat arrays `predict` and `target`
+        binarized with `threshold`.
+        """
+        intersect = 0.0
+        union = 0.0
+        for i in range(predict.shape[0]):
+            p = 1.0 if predict[i] >= threshold else 0.0
+            t = 1.0 if target[i] >= threshold else 0.0
+            intersect += p * t
+            union += p + t - p * t
+        return intersect, union
+
+
 class Timer:
     def __init__(self, name=None):
         self.name = name if name is not None else "timer"
@@ -6,7 +6,7 @@
 
 import os
 import zipfile
-import glob
+import shutil
 import logging
 import multiprocessing
 import numpy as np
@@ -36,33 +36,70 @@ def get_co3d_sequence_set_from_subset_name(subset_name: str) -> CO3DSequenceSet:
     return CO3DSequenceSet(subset_name.split("_")[1])
 
 
-def unzip(file_path: str, output_dir: str):
+def unzip(file_path: str, output_dir: str, buffer_size: int = 4 * 1024 * 1024):
+    """
+    Extract the zip archive `file_path` into `output_dir`.
+
+    The members are streamed to disk with a large copy buffer which is considerably
+    faster than the default one of `ZipFile.extractall` for big archives.
+    """
+    output_dir = os.path.abspath(output_dir)
     with zipfile.ZipFile(file_path, "r") as zip_ref:
-        zip_ref.extractall(output_dir)
+        members = []
+        for info in zip_ref.infolist():
+            arcname = _sanitize_zip_member_name(info.filename)
+            if len(arcname) == 0:
+                continue
+            members.append((info, os.path.join(output_dir, arcname)))
+
+        # create all directories at once
+        all_dirs = set(
+            target if info.is_dir() else os.path.dirname(target)
+            for info, target in members
+        )
+        for dir_ in all_dirs:
+            os.makedirs(dir_, exist_ok=True)
+
+        for info, target in members:
+            if info.is_dir():
+                continue
+            with zip_ref.open(info) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, length=buffer_size)
+
+
+def _sanitize_zip_member_name(filename: str) -> str:
+    """
+    Convert a zip member name to a relative path the same way as
+    `ZipFile.extractall` does, i.e. strip the drive and leading separators
+    and drop the empty, "." and ".." path components.
+    """
+    arcname = filename.replace("/", os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    invalid_path_parts = ("", os.path.curdir, os.path.pardir)
+    return os.path.sep.join(
+        x for x in arcname.split(os.path.sep) if x not in invalid_path_parts
+    )
 
 
 def check_user_submission_file_paths(
     ground_truth_files: Dict[str, str],
     user_submission_files: Dict[str, str],
 ):
-    missing_gt_examples = [
-        gt_example_name
-        for gt_example_name in ground_truth_files
-        if gt_example_name not in user_submission_files
-    ]
+    missing_gt_examples = ground_truth_files.keys() - user_submission_files.keys()
     if len(missing_gt_examples) > 0:
         raise ValueError(
-            f"There are missing evaluation examples: {str(missing_gt_examples)}"
+            f"There are missing evaluation examples: {str(sorted(missing_gt_examples))}"
         )
 
-    additional_user_examples = [
-        user_example
-        for user_example in user_submission_files
-        if user_example not in ground_truth_files
-    ]
+    additional_user_examples = (
+        user_submission_files.keys() - ground_truth_files.keys()
+    )
     if len(additional_user_examples) > 0:
         raise ValueError(
-            f"Unexpected submitted evaluation examples {str(additional_user_examples)}"
+            "Unexpected submitted evaluation examples"
+            f" {str(sorted(additional_user_examples))}"
         )
 
 
@@ -85,36 +122,48 @@ def get_result_directory_file_names(
         result_files: dict {test_example_name_i: root_path_i}
     """
 
-    result_type_files = {}
-    for result_type in ("image", "mask", "depth"):
-        postfix = get_data_type_postfix(result_type)
-        matching_files = sorted(glob.glob(os.path.join(result_dir, f"*{postfix}")))
-        if has_depth_masks and result_type=="mask":
-            matching_files = [
-                f for f in matching_files 
-                if not f.endswith(get_data_type_postfix("depth_mask"))
-            ]
-        result_type_files[result_type] = {
-            os.path.split(f)[-1][: -len(postfix)]: f for f in matching_files
-        }
+    result_types = ("image", "mask", "depth")
+    postfixes = {
+        result_type: get_data_type_postfix(result_type) for result_type in result_types
+    }
+    # (result_type, postfix, postfix_length) triplets for the directory scan
+    postfix_items = [
+        (result_type, postfix, len(postfix)) for result_type, postfix in postfixes.items()
+    ]
+    depth_mask_postfix = get_data_type_postfix("depth_mask")
+
+    # enumerate the directory only once and sort the entries by their postfix
+    result_type_files = {result_type: {} for result_type in result_types}
+    with os.scandir(result_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith("."):
+                # glob-style: skip hidden files
+                continue
+            for result_type, postfix, postfix_len in postfix_items:
+                if not name.endswith(postfix):
+                    continue
+                if (
+                    has_depth_masks
+                    and result_type == "mask"
+                    and name.endswith(depth_mask_postfix)
+                ):
+                    continue
+                result_type_files[result_type][name[:-postfix_len]] = entry.path
 
     example_names = sorted(
-        list(
-            set(
-                [
-                    n
-                    for t in ("image", "mask", "depth")
-                    for n in result_type_files[t].keys()
-                ]
-            )
-        )
+        result_type_files["image"].keys()
+        | result_type_files["mask"].keys()
+        | result_type_files["depth"].keys()
     )
 
     missing_examples = defaultdict(list)
-    for example_name in example_names:
-        for result_type in ("image", "mask", "depth"):
-            if example_name not in result_type_files[result_type]:
-                missing_examples[example_name].append(result_type)
+    if any(len(result_type_files[t]) != len(example_names) for t in result_types):
+        # only look for the incomplete examples if there are some
+        for example_name in example_names:
+            for result_type in result_types:
+                if example_name not in result_type_files[result_type]:
+                    missing_examples[example_name].append(result_type)
 
     if len(missing_examples) > 0:
         msg = "\n".join(
@@ -125,8 +174,10 @@ def get_result_directory_file_names(
             + msg
         )
 
+    image_files = result_type_files["image"]
+    image_postfix_len = len(postfixes["image"])
     result_files = {
-        example_name: result_type_files["image"][example_name][: -len("_image.png")]
+        example_name: image_files[example_name][:-image_postfix_len]
         for example_name in example_names
     }
 
@@ -166,7 +217,24 @@ def evaluate_file_folders(
     num_workers: int = 0,
     remaining_time: float = float("Inf"),
     print_per_example_results: bool = True,
+    return_per_example: bool = True,
 ):
+    """
+    Evaluate the predictions in `pred_folder` against the ground truth in `gt_folder`.
+
+    Args:
+        pred_folder: The folder with the predicted results.
+        gt_folder: The folder with the ground truth data.
+        num_workers: The number of evaluation processes. Evaluates serially if <= 0.
+        remaining_time: The time budget for the evaluation in seconds.
+        print_per_example_results: If `True`, logs the metrics of each example.
+        return_per_example: If `False`, the per-example results are not kept in memory
+            and `None` is returned in their place.
+
+    Returns:
+        result: A dict {metric_name: metric_value} with metrics averaged over examples.
+        per_example_results: A list of per-example metric dicts or `None`.
+    """
     # determine how much time do we have for the evaluation
     max_time = time.time() + remaining_time 
 
@@ -182,47 +250,44 @@ def evaluate_file_folders(
     # At this point we are sure that ground_truth_files contain the same
     # examples as user_submission_files.
 
+    arg_list = [
+        (
+            gt_example,
+            ground_truth_files[gt_example],
+            user_submission_files[gt_example],
+            max_time,
+            print_per_example_results,
+        ) for gt_example in ground_truth_files
+    ]
+
+    totals = {metric: 0.0 for metric in EVAL_METRIC_NAMES}
+    per_example_results = [] if return_per_example else None
+
+    def _accumulate(results):
+        # accumulate the metrics on the fly so that the per-example results
+        # do not have to be kept unless requested
+        for r in results:
+            for metric in EVAL_METRIC_NAMES:
+                totals[metric] += r[metric]
+            if per_example_results is not None:
+                per_example_results.append(r)
+
     if num_workers <= 0:
         # Iterate over the gt examples:
-        per_example_results = [
-            _evaluate_pred_gt_pair(
-                (
-                    gt_example,
-                    ground_truth_files[gt_example],
-                    user_submission_files[gt_example],
-                    max_time,
-                    print_per_example_results,
-                )
-            ) for gt_example in tqdm(list(ground_truth_files))
-        ]    
-        # gt_rgbda = load_rgbda_frame(ground_truth_files[gt_example], check_for_depth_mask=True)
-        # pred_rgbda = load_rgbda_frame(user_submission_files[gt_example])
-        # check_same_rgbda_sizes(gt_rgbda, pred_rgbda, gt_example)
-        # per_example_results.append(eval_one(pred_rgbda, gt_rgbda))
+        _accumulate(_evaluate_pred_gt_pair(args) for args in tqdm(arg_list))
     else:
-        # parallel processing
-        arg_list = [
-            (
-                gt_example,
-                ground_truth_files[gt_example],
-                user_submission_files[gt_example],
-                max_time,
-                print_per_example_results,
-            ) for gt_example in list(ground_truth_files)
-        ]
-        pool = multiprocessing.Pool(num_workers)
-        per_example_results = [
-            result for result in tqdm(
-                pool.imap(_evaluate_pred_gt_pair, arg_list),
-                total=len(arg_list),
+        # parallel processing, hand out the examples in chunks to amortize the
+        # inter-process communication; imap keeps the order of the examples
+        chunksize = max(1, len(arg_list) // (4 * num_workers))
+        with multiprocessing.Pool(num_workers) as pool:
+            _accumulate(
+                tqdm(
+                    pool.imap(_evaluate_pred_gt_pair, arg_list, chunksize=chunksize),
+                    total=len(arg_list),
+                )
             )
-        ]
-        pool.terminate()
-        
-    result = {
-        metric: (sum(r[metric] for r in per_example_results) / len(per_example_results))
-        for metric in EVAL_METRIC_NAMES
-    }
+
+    result = {metric: totals[metric] / len(arg_list) for metric in EVAL_METRIC_NAMES}
 
     return result, per_example_results
 
@@ -7,8 +7,11 @@
 
 import logging
 import os
+import numpy as np
 import torch
 import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from omegaconf import DictConfig
 
@@ -20,6 +23,7 @@ from pytorch3d.implicitron.dataset.json_index_dataset_map_provider_v2 import (
     JsonIndexDatasetMapProviderV2
 )
 from pytorch3d.implicitron.tools.config import expand_args_fields
+from pytorch3d.structures import Pointclouds
 
 from co3d.utils import dbir_utils
 from co3d.challenge.co3d_submission import CO3DSubmission
@@ -29,11 +33,17 @@ from co3d.dataset.utils import redact_eval_frame_data, _check_valid_eval_frame_d
 
 DATASET_ROOT = os.getenv("CO3DV2_DATASET_ROOT")
 DATASET_ROOT_HIDDEN = os.getenv("CO3DV2_HIDDEN_DATASET_ROOT")
+# set CO3D_EVAL_VALIDATE=0 to skip the per-frame sanity checks of the eval data
+EVAL_VALIDATE = os.getenv("CO3D_EVAL_VALIDATE", "1") == "1"
 
 
 logger = logging.getLogger(__name__)
 
 
+# expand the dataclass fields of the provider only once
+expand_args_fields(JsonIndexDatasetMapProviderV2)
+
+
 def get_dataset_map(
     dataset_root: str,
     category: str,
@@ -42,7 +52,6 @@ def get_dataset_map(
     """
     Obtain the dataset map that contains the train/val/test dataset objects.
     """
-    expand_args_fields(JsonIndexDatasetMapProviderV2)
     dataset_map_provider = JsonIndexDatasetMapProviderV2(
         category=category,
         subset_name=subset_name,
@@ -55,7 +64,7 @@ def get_dataset_map(
     return dataset_map_provider.get_dataset_map()
 
 
-@torch.no_grad()
+@torch.inference_mode()
 def update_dbir_submission_with_category_and_subset_predictions(
     submission: CO3DSubmission,
     dataset_root: str,
@@ -65,6 +74,7 @@ def update_dbir_submission_with_category_and_subset_predictions(
     cheat_with_gt_data: bool = True,
     load_dataset_pointcloud: bool = False,
     point_radius: float = 0.01,
+    flush_every: int = 32,
 ):
     """
     Updates the CO3DSubmission object `submission` with predictions of a DBIR
@@ -82,6 +92,10 @@ def update_dbir_submission_with_category_and_subset_predictions(
         load_dataset_pointcloud: If `True`, uses the ground truth dataset
             pointclouds instead of unprojecting known views.
         point_radius: The radius of the rendered points.
+        flush_every: The number of buffered results that are stored at once.
+
+    Setting the environment variable CO3D_EVAL_VALIDATE=0 disables the per-frame
+    sanity check of the redacted evaluation frame data.
     """
 
     logger.info(
@@ -115,11 +129,16 @@ def update_dbir_submission_with_category_and_subset_predictions(
     # The test dataloader simply iterates over test_dataset.eval_batches
     # this is done by setting test_dataset.eval_batches as the batch sampler
     test_dataset = dataset_map["test"]
+    # do not spawn more workers than there are eval batches to load
+    num_loader_workers = min(num_workers, len(test_dataset.eval_batches))
+    # keep the workers loading ahead while the point clouds are being rendered
+    prefetch_kwargs = {"prefetch_factor": 4} if num_loader_workers > 0 else {}
     test_dataloader = torch.utils.data.DataLoader(
         test_dataset,
         batch_sampler=test_dataset.eval_batches,
-        num_workers=num_workers,
+        num_workers=num_loader_workers,
         collate_fn=FrameData.collate,
+        **prefetch_kwargs,
     )
 
     # loop over eval examples
@@ -132,77 +151,165 @@ def update_dbir_submission_with_category_and_subset_predictions(
         # the test dataloader to spam a warning message,
         # we suppress this warning with the following line
         warnings.filterwarnings("ignore", message="Empty masks_for_bbox.*")
-    
-    for eval_index, eval_frame_data in enumerate(tqdm(test_dataloader)):
-        # the first element of eval_frame_data is the actual evaluation image,
-        # the 2nd-to-last elements are the knwon source images used for building 
-        # the reconstruction (source images are present only for the few-view task)
-
-        # move the eval data to the requested device
-        eval_frame_data = eval_frame_data.to(device)
-
-        # sanity check that the eval frame data has correctly redacted entries
-        _check_valid_eval_frame_data(eval_frame_data, task, sequence_set)
-
-        if cheat_with_gt_data:
-            # Cheat by taking the ground truth data. This should give in perfect metrics.
-            mask_render = (eval_frame_data.fg_probability[:1] > 0.5).float()
-            render_crop = ImplicitronRender(
-                depth_render = eval_frame_data.depth_map[:1],
-                image_render = eval_frame_data.image_rgb[:1] * mask_render,
-                mask_render = mask_render,
-            )
 
-        else:
-            if task==CO3DTask.MANY_VIEW:
-                # we use the sequence pointcloud extracted above
-                scene_pointcloud = sequence_pointcloud
-            elif task==CO3DTask.FEW_VIEW:
-                # we build the pointcloud by unprojecting the depth maps of the known views
-                # which are elements (1:end) of the eval batch
-                scene_pointcloud = dbir_utils.get_eval_frame_data_pointcloud(
-                    eval_frame_data,
+    # The results are buffered and stored in batches of `flush_every` frames.
+    # Storing a batch (png encoding + writing) is offloaded to a background thread
+    # so that the next frames can be rendered in the meantime. At most
+    # `max_pending_store_batches` batches are kept in memory waiting to be stored.
+    max_pending_store_batches = 2
+    store_executor = ThreadPoolExecutor(max_workers=1)
+    store_futures = []
+    pending_results = _empty_pending_results()
+
+    def _flush_pending_results(pending_results):
+        if len(pending_results["sequence_names"]) > 0:
+            store_futures.append(
+                store_executor.submit(
+                    submission.add_results_batch,
+                    category=category,
+                    subset_name=subset_name,
+                    staged=True,
+                    **pending_results,
                 )
+            )
+        while len(store_futures) > max_pending_store_batches:
+            # wait for the oldest batch to be stored, re-raises potential errors
+            store_futures.pop(0).result()
+        return _empty_pending_results()
+
+    # select how to obtain the scene point cloud once instead of for every frame
+    if task==CO3DTask.MANY_VIEW:
+        # we use the sequence pointcloud extracted above
+        def get_scene_pointcloud(eval_frame_data):
+            return sequence_pointcloud
+    elif task==CO3DTask.FEW_VIEW:
+        # we build the pointcloud by unprojecting the depth maps of the known views
+        # which are elements (1:end) of the eval batch,
+        # point clouds of the recently seen source views are cached
+        fewview_pointcloud_cache = OrderedDict()
+        def get_scene_pointcloud(eval_frame_data):
+            return _get_eval_frame_data_pointcloud_cached(
+                eval_frame_data,
+                fewview_pointcloud_cache,
+            )
+    else:
+        raise ValueError(task)
+
+    try:
+        for eval_index, eval_frame_data in enumerate(tqdm(test_dataloader)):
+            # the first element of eval_frame_data is the actual evaluation image,
+            # the 2nd-to-last elements are the knwon source images used for building 
+            # the reconstruction (source images are present only for the few-view task)
+
+            # move the eval data to the requested device
+            eval_frame_data = eval_frame_data.to(device)
+
+            # sanity check that the eval frame data has correctly redacted entries
+            if EVAL_VALIDATE:
+                _check_valid_eval_frame_data(eval_frame_data, task, sequence_set)
+
+            if cheat_with_gt_data:
+                # Cheat by taking the ground truth data. This should give in perfect metrics.
+                mask_render = (eval_frame_data.fg_probability[:1] > 0.5).float()
+                render_crop = ImplicitronRender(
+                    depth_render = eval_frame_data.depth_map[:1],
+                    image_render = eval_frame_data.image_rgb[:1] * mask_render,
+                    mask_render = mask_render,
+                )
+
             else:
-                raise ValueError(task)
-            # Redact the frame data so we are sure we cannot use the data
-            # from the actual unobserved evaluation sample
-            eval_frame_data = redact_eval_frame_data(eval_frame_data)
-            # Obtain the image render. In case dataset_test.box_crop==True,
-            # we need to paste the render back to the original image bounds.
-            render_crop = dbir_utils.render_point_cloud(
-                eval_frame_data.camera[[0]],
-                eval_frame_data.image_rgb.shape[-2:],
-                scene_pointcloud,
-                point_radius=point_radius,
+                scene_pointcloud = get_scene_pointcloud(eval_frame_data)
+                # Redact the frame data so we are sure we cannot use the data
+                # from the actual unobserved evaluation sample
+                eval_frame_data = redact_eval_frame_data(eval_frame_data)
+                # Obtain the image render. In case dataset_test.box_crop==True,
+                # we need to paste the render back to the original image bounds.
+                render_crop = dbir_utils.render_point_cloud(
+                    eval_frame_data.camera[[0]],
+                    eval_frame_data.image_rgb.shape[-2:],
+                    scene_pointcloud,
+                    point_radius=point_radius,
+                )
+
+            # cut the valid part of the render and paste into the original image canvas
+            render_full_image = dbir_utils.paste_render_to_original_image(
+                eval_frame_data, render_crop
             )
 
-        # cut the valid part of the render and paste into the original image canvas
-        render_full_image = dbir_utils.paste_render_to_original_image(
-            eval_frame_data, render_crop
-        )
+            # get the image, mask, depth as numpy arrays for the challenge submission,
+            # the renders are concatenated along channels to do a single device->host copy
+            renders = [
+                getattr(render_full_image, f"{data_type}_render")[0]
+                for data_type in ["image", "mask", "depth"]
+            ]
+            renders_np = torch.cat(renders, dim=0).cpu().numpy()
+            image, mask, depth = np.split(
+                renders_np, np.cumsum([r.shape[0] for r in renders[:-1]]), axis=0
+            )
 
-        # get the image, mask, depth as numpy arrays for the challenge submission
-        image, mask, depth = [
-            getattr(render_full_image, f"{data_type}_render").cpu().numpy()[0]
-            for data_type in ["image", "mask", "depth"]
-        ]
-
-        # add the results to the submission object
-        submission.add_result(
-            category=category,
-            subset_name=subset_name,
-            sequence_name=eval_frame_data.sequence_name[0],
-            frame_number=int(eval_frame_data.frame_number[0]),
-            image=image,
-            mask=mask,
-            depth=depth,
-        )
+            # add the results to the submission object
+            pending_results["sequence_names"].append(eval_frame_data.sequence_name[0])
+            pending_results["frame_numbers"].append(int(eval_frame_data.frame_number[0]))
+            pending_results["images"].append(image)
+            pending_results["masks"].append(mask)
+            pending_results["depths"].append(depth)
+            if len(pending_results["sequence_names"]) >= flush_every:
+                pending_results = _flush_pending_results(pending_results)
+
+        # store the remaining results
+        _flush_pending_results(pending_results)
+    finally:
+        # Wait for all results to be stored and move them from staging to
+        # the submission cache. This is done also in case the rendering fails since
+        # the stored results are already registered with the submission.
+        store_executor.shutdown(wait=True)
+        submission.commit_staged_results(category, subset_name)
+
+    # re-raise potential storage errors
+    for store_future in store_futures:
+        store_future.result()
 
     # reset all warnings
     warnings.simplefilter("always")
 
 
+def _get_eval_frame_data_pointcloud_cached(
+    eval_frame_data: FrameData,
+    pointcloud_cache: OrderedDict,
+    max_cache_size: int = 16,
+) -> Pointclouds:
+    """
+    Returns the point cloud unprojected from the known source views (elements 1:end)
+    of `eval_frame_data`. Since successive eval batches often share the source views,
+    the point clouds are kept in the LRU cache `pointcloud_cache` keyed by
+    the sequence names and frame numbers of the source views.
+    """
+    src_views_key = tuple(
+        (sequence_name, int(frame_number))
+        for sequence_name, frame_number in zip(
+            eval_frame_data.sequence_name[1:], eval_frame_data.frame_number[1:]
+        )
+    )
+    pointcloud = pointcloud_cache.pop(src_views_key, None)
+    if pointcloud is None:
+        pointcloud = dbir_utils.get_eval_frame_data_pointcloud(eval_frame_data)
+    pointcloud_cache[src_views_key] = pointcloud
+    if len(pointcloud_cache) > max_cache_size:
+        # drop the least recently used point cloud
+        pointcloud_cache.popitem(last=False)
+    return pointcloud
+
+
+def _empty_pending_results():
+    return {
+        "sequence_names": [],
+        "frame_numbers": [],
+        "images": [],
+        "masks": [],
+        "depths": [],
+    }
+
+
 def make_dbir_submission(
     dataset_root = DATASET_ROOT,
     task = CO3DTask.MANY_VIEW,
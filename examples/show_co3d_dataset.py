@@ -8,7 +8,7 @@ import random
 
 from tqdm import tqdm
 from omegaconf import DictConfig
-from typing import Tuple
+from typing import Iterable, List, Tuple
 
 from co3d.utils import dbir_utils 
 from pytorch3d.renderer.cameras import CamerasBase
@@ -24,6 +24,10 @@ DATASET_ROOT = os.getenv("CO3DV2_DATASET_ROOT")
 
 
 logger = logging.getLogger(__file__)
+
+
+# expand the dataclass fields of the provider only once
+expand_args_fields(JsonIndexDatasetMapProviderV2)
         
 
 def main(
@@ -63,7 +67,6 @@ def main(
                 continue
 
             # obtain the dataset
-            expand_args_fields(JsonIndexDatasetMapProviderV2)
             dataset_map = JsonIndexDatasetMapProviderV2(
                 category=category,
                 subset_name=subset_name,
@@ -77,13 +80,10 @@ def main(
 
             train_dataset = dataset_map["train"]
 
-            # select few sequences to visualize
-            sequence_names = list(train_dataset.seq_annots.keys())
-
-            # select few sequence names
-            show_sequence_names = random.sample(
-                sequence_names,
-                k=min(n_show_sequences_per_category, len(sequence_names)),
+            # select few sequence names to visualize
+            show_sequence_names = _reservoir_sample(
+                train_dataset.seq_annots.keys(),
+                k=n_show_sequences_per_category,
             )
             
             for sequence_name in show_sequence_names:
@@ -131,6 +131,22 @@ def main(
                     )
 
 
+def _reservoir_sample(items: Iterable, k: int) -> List:
+    """
+    Uniformly sample (up to) `k` elements from `items` in a single pass
+    without materializing `items` in memory.
+    """
+    reservoir = []
+    for i, item in enumerate(items):
+        if i < k:
+            reservoir.append(item)
+        else:
+            j = random.randint(0, i)
+            if j < k:
+                reservoir[j] = item
+    return reservoir
+
+
 class PointcloudRenderingModel(torch.nn.Module):
     def __init__(
         self,
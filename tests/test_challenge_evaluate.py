@@ -2,6 +2,7 @@ import os
 import unittest
 import numpy as np
 import tempfile
+import zipfile
 import torch
 
 from pytorch3d.renderer.cameras import look_at_view_transform, PerspectiveCameras
@@ -21,9 +22,15 @@ from co3d.challenge.io import (
     store_rgbda_frame,
     load_rgbda_frame,
 )
-from co3d.challenge.utils import get_result_directory_file_names, evaluate_file_folders
-from co3d.challenge.metric_utils import eval_one
-from co3d.challenge.data_types import RGBDAFrame
+from co3d.challenge.utils import (
+    get_result_directory_file_names,
+    evaluate_file_folders,
+    unzip,
+)
+from co3d.challenge import metric_utils
+from co3d.challenge.metric_utils import eval_one, calc_mse, calc_iou
+from co3d.challenge.data_types import RGBDAFrame, CO3DTask, CO3DSequenceSet
+from co3d.challenge.co3d_submission import CO3DSubmission
 
 
 class TestIO(unittest.TestCase):
@@ -96,6 +103,47 @@ class TestMetricUtils(unittest.TestCase):
                     # print(f"{k:15s}: {eval_batch_result[k]:1.3e} - {eval_one_result[k]:1.3e}")
 
 
+    def test_mse_iou(self):
+        H = 100
+        W = 200
+        for _ in range(10):
+            x, y = [np.random.uniform(size=(3, H, W)).astype(np.float32) for _ in range(2)]
+            mask = (np.random.uniform(size=(1, H, W)) > 0.5).astype(np.float32)
+            mse = ((x - y) ** 2).mean()
+            mse_masked = ((x - y) ** 2 * mask).sum() / (mask.sum() * 3)
+            self.assertTrue(np.allclose(calc_mse(x, y), mse, rtol=1e-4))
+            self.assertTrue(np.allclose(calc_mse(x, y, mask=mask), mse_masked, rtol=1e-4))
+            p, t = x[:1] >= 0.5, y[:1] >= 0.5
+            iou = (p & t).sum() / ((p | t).sum() + 1e-4)
+            self.assertTrue(np.allclose(calc_iou(x[:1], y[:1]), iou, rtol=1e-4))
+
+    @unittest.skipUnless(
+        metric_utils._NUMBA_AVAILABLE,
+        "numba is not installed (optional), calc_mse/calc_iou use numpy",
+    )
+    def test_mse_iou_numba(self):
+        H = 100
+        W = 200
+        for _ in range(10):
+            x, y = [np.random.uniform(size=(3, H, W)).astype(np.float32) for _ in range(2)]
+            mask = (np.random.uniform(size=(1, H, W)) > 0.5).astype(np.float32)
+            sq_err_sum = metric_utils._sq_err_sum_numba(x.reshape(-1), y.reshape(-1))
+            self.assertTrue(np.allclose(sq_err_sum, ((x - y) ** 2).sum(), rtol=1e-4))
+            sq_err_sum, mask_mass = metric_utils._masked_sq_err_sum_numba(
+                x.reshape(3, -1), y.reshape(3, -1), mask.reshape(-1)
+            )
+            self.assertTrue(
+                np.allclose(sq_err_sum, ((x - y) ** 2 * mask).sum(), rtol=1e-4)
+            )
+            self.assertTrue(np.allclose(mask_mass, mask.sum() * 3))
+            intersect, union = metric_utils._iou_sums_numba(
+                x[0].reshape(-1), y[0].reshape(-1), 0.5
+            )
+            p, t = x[0] >= 0.5, y[0] >= 0.5
+            self.assertEqual(intersect, (p & t).sum())
+            self.assertEqual(union, (p | t).sum())
+
+
 class TestEvalScript(unittest.TestCase):
     def test_fake_data(self):
         N = 30
@@ -115,6 +163,12 @@ class TestEvalScript(unittest.TestCase):
                 )
             self.assertTrue(len(per_example_result) == N)
 
+            avg_result_, per_example_result_ = evaluate_file_folders(
+                tmp_pred, tmp_gt, return_per_example=False
+            )
+            self.assertIsNone(per_example_result_)
+            for m in metrics:
+                self.assertTrue(np.allclose(avg_result_[m], avg_result[m]))
 
     def test_wrong_fake_data(self):
         N = 30
@@ -149,12 +203,137 @@ class TestEvalScript(unittest.TestCase):
                     evaluate_file_folders(tmp_pred, tmp_gt)
 
 
+class TestSubmission(unittest.TestCase):
+    def test_add_results_batch(self):
+        N = 5
+        H = 60
+        W = 80
+        with tempfile.TemporaryDirectory() as tmpd:
+            submission = _make_submission(tmpd)
+            _add_random_results_batch(submission, "car", "manyview_dev_0", N, H, W)
+            result_dir = CO3DSubmission.get_submission_cache_image_dir(
+                submission.submission_cache, "car", "manyview_dev_0"
+            )
+            result_files = get_result_directory_file_names(result_dir)
+            self.assertEqual(len(result_files), N)
+            self.assertEqual(len(submission._result_list), N)
+            for res in submission._result_list:
+                self.assertIn(res.get_image_name(), result_files)
+                rgbda = load_rgbda_frame(result_files[res.get_image_name()])
+                self.assertEqual(rgbda.image.shape, (3, H, W))
+
+    def test_commit_staged_results(self):
+        N = 4
+        H = 60
+        W = 80
+        with tempfile.TemporaryDirectory() as tmpd:
+            submission = _make_submission(tmpd)
+            result_dir = CO3DSubmission.get_submission_cache_image_dir(
+                submission.submission_cache, "car", "manyview_dev_0"
+            )
+            # first commit into a non-existent cache dir, then into an existing one
+            for first_frame in [0, N]:
+                _add_random_results_batch(
+                    submission,
+                    "car",
+                    "manyview_dev_0",
+                    N,
+                    H,
+                    W,
+                    first_frame=first_frame,
+                    staged=True,
+                )
+                self.assertTrue(os.path.isdir(submission.submission_staging))
+                submission.commit_staged_results("car", "manyview_dev_0")
+                self.assertFalse(os.path.exists(submission.submission_staging))
+                result_files = get_result_directory_file_names(result_dir)
+                self.assertEqual(len(result_files), first_frame + N)
+            self.assertEqual(
+                sorted(result_files),
+                sorted(r.get_image_name() for r in submission._result_list),
+            )
+
+    def test_add_results_batch_wrong_lengths(self):
+        H = 60
+        W = 80
+        with tempfile.TemporaryDirectory() as tmpd:
+            submission = _make_submission(tmpd)
+            frames = [_random_rgbda_frame(H, W) for _ in range(3)]
+            with self.assertRaisesRegex(ValueError, "same number of results"):
+                submission.add_results_batch(
+                    category="car",
+                    subset_name="manyview_dev_0",
+                    sequence_names=["seq"] * 3,
+                    frame_numbers=[0, 1],
+                    images=[f.image for f in frames],
+                    masks=[f.mask for f in frames],
+                    depths=[f.depth for f in frames],
+                )
+
+
+class TestUnzip(unittest.TestCase):
+    def test_unzip(self):
+        with tempfile.TemporaryDirectory() as tmpd:
+            zip_path = os.path.join(tmpd, "archive.zip")
+            with zipfile.ZipFile(zip_path, "w") as zip_ref:
+                zip_ref.writestr("a/b/c.txt", "c" * 100000)
+                zip_ref.writestr("top.txt", "top")
+                zip_ref.writestr("empty_dir/", "")
+            output_dir = os.path.join(tmpd, "out")
+            unzip(zip_path, output_dir)
+            with open(os.path.join(output_dir, "a", "b", "c.txt"), "r") as f:
+                self.assertEqual(f.read(), "c" * 100000)
+            with open(os.path.join(output_dir, "top.txt"), "r") as f:
+                self.assertEqual(f.read(), "top")
+            self.assertTrue(os.path.isdir(os.path.join(output_dir, "empty_dir")))
+
+    def test_unzip_sanitizes_member_names(self):
+        # like ZipFile.extractall, ".." components and leading separators are dropped
+        # so that all members are extracted inside the output folder
+        with tempfile.TemporaryDirectory() as tmpd:
+            zip_path = os.path.join(tmpd, "archive.zip")
+            with zipfile.ZipFile(zip_path, "w") as zip_ref:
+                zip_ref.writestr("../evil.txt", "evil")
+                zip_ref.writestr("/abs/b.txt", "abs")
+            output_dir = os.path.join(tmpd, "out")
+            unzip(zip_path, output_dir)
+            self.assertFalse(os.path.exists(os.path.join(tmpd, "evil.txt")))
+            with open(os.path.join(output_dir, "evil.txt"), "r") as f:
+                self.assertEqual(f.read(), "evil")
+            with open(os.path.join(output_dir, "abs", "b.txt"), "r") as f:
+                self.assertEqual(f.read(), "abs")
+
+
 def _generate_random_submission_data(folder, N, H, W):
     for example_num in range(N):
         root_path = os.path.join(folder, f"example_{example_num}")
         store_rgbda_frame(_random_rgbda_frame(H, W), root_path)
 
 
+def _make_submission(output_folder):
+    return CO3DSubmission(
+        task=CO3DTask.MANY_VIEW,
+        sequence_set=CO3DSequenceSet.DEV,
+        output_folder=output_folder,
+    )
+
+
+def _add_random_results_batch(
+    submission, category, subset_name, N, H, W, first_frame=0, staged=False
+):
+    frames = [_random_rgbda_frame(H, W) for _ in range(N)]
+    submission.add_results_batch(
+        category=category,
+        subset_name=subset_name,
+        sequence_names=["seq"] * N,
+        frame_numbers=list(range(first_frame, first_frame + N)),
+        images=[f.image for f in frames],
+        masks=[f.mask for f in frames],
+        depths=[f.depth for f in frames],
+        staged=staged,
+    )
+
+
 def _random_implicitron_render(
     N: int,
     H: int,